@@ -1,26 +1,65 @@
 # main.py
-from flask import Flask, request, jsonify, render_template
+from flask import Blueprint, Flask, current_app, request, jsonify, render_template
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timezone
-from dateutil import parser
-from haversine import haversine, Unit
+from sqlalchemy import event, func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import orjson
+import atexit
+import functools
+import hmac
+import logging
+import math
 import os
+import queue
+import threading
+import time
+
+try:
+    from numba import njit
+except ImportError:  # listed in requirements; NumPy / pure-Python kernels cover installs without it
+    njit = None
 
 # ---- Config ----
 API_KEY = os.environ.get("API_KEY", "dev_key_please_change")
+_API_KEY_B = API_KEY.encode()
 GEOfences = {
     "A": {"lat": 12.9710, "lon": 77.5946, "radius_m": 80},
     "B": {"lat": 12.9720, "lon": 77.5956, "radius_m": 80}
 }
+EARTH_RADIUS_M = 6371008.8
 MIN_TRIP_TIME_S = 30
 MIN_TRIP_DISTANCE_M = 20
 EMISSION_FACTOR_KG_PER_KM = 0.20
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+LOC_QUEUE_MAX = 10000
+LOC_BATCH_MAX = 500
+LOC_FLUSH_INTERVAL_S = 0.1
+DEVICE_TOUCH_INTERVAL = timedelta(seconds=60)
+
+# ---- DB ----
+# every write goes through Core statements, so there is nothing for autoflush to do
+db = SQLAlchemy(session_options={"autoflush": False})
+
+# WAL lets dashboard reads run alongside ingest writes; synchronous=NORMAL
+# drops the per-commit fsync (safe in WAL mode).
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+)
 
-# ---- App & DB ----
-app = Flask(__name__, template_folder="templates", static_folder="static")
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///ebuggy.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-db = SQLAlchemy(app)
+def set_sqlite_pragmas(dbapi_conn, conn_record):
+    cur = dbapi_conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
 
 # ---- Models ----
 class Device(db.Model):
@@ -37,6 +76,9 @@ class Location(db.Model):
     speed_kmh = db.Column(db.Float, nullable=True)
     timestamp = db.Column(db.DateTime, nullable=False)
 
+# serves the per-device "latest fix" lookup without scanning location
+loc_dev_ts_index = db.Index("ix_loc_dev_ts", Location.device_id, Location.timestamp.desc())
+
 class Trip(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.String, nullable=False)
@@ -49,151 +91,382 @@ class Trip(db.Model):
     distance_m = db.Column(db.Float)
     duration_s = db.Column(db.Float)
 
-# create tables (safe on import)
-with app.app_context():
-    db.create_all()
+# per-day trip totals, maintained alongside every trip insert
+class TripDaily(db.Model):
+    day = db.Column(db.String, primary_key=True)
+    cnt = db.Column(db.Integer, nullable=False, default=0)
+    m_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+# R-Tree over location points for bounding-box lookups, kept in sync by
+# triggers so every insert path (including the batch flusher) is covered.
+# R-Tree coordinates are 32-bit floats, so treat hits as candidates only.
+LOCATION_RTREE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS location_rtree USING rtree(id, minLat, maxLat, minLon, maxLon)",
+    "CREATE TRIGGER IF NOT EXISTS location_rtree_ai AFTER INSERT ON location BEGIN "
+    "INSERT INTO location_rtree VALUES (new.id, new.lat, new.lat, new.lon, new.lon); END",
+    "CREATE TRIGGER IF NOT EXISTS location_rtree_ad AFTER DELETE ON location BEGIN "
+    "DELETE FROM location_rtree WHERE id = old.id; END",
+    # backfill rows written before the trigger existed
+    "INSERT INTO location_rtree SELECT id, lat, lat, lon, lon FROM location "
+    "WHERE id > (SELECT COALESCE(MAX(id), 0) FROM location_rtree)",
+)
 
 # ---- Helpers ----
 def parse_iso(ts):
     try:
         if isinstance(ts, str):
-            return parser.isoparse(ts)
+            return datetime.fromisoformat(ts.replace("Z", "+00:00"))
         else:
             return datetime.fromtimestamp(float(ts), tz=timezone.utc)
     except:
         return datetime.utcnow().replace(tzinfo=timezone.utc)
 
-def inside_geofence(lat, lon, fence):
-    d = haversine((lat, lon), (fence["lat"], fence["lon"]), unit=Unit.METERS)
-    return d <= fence["radius_m"]
+def _wall_time(dt):
+    # SQLite's DateTime keeps the device's wall time and drops the offset;
+    # caches, trip state and comparisons use that same naive value
+    return dt.replace(tzinfo=None)
+
+def _fence_bbox(fence):
+    # degrees of lat/lon covered by the fence circle
+    ang = fence["radius_m"] / EARTH_RADIUS_M
+    dlat = math.degrees(ang)
+    dlon = math.degrees(math.asin(min(1.0, math.sin(ang) / math.cos(math.radians(fence["lat"])))))
+    return (fence["lat"] - dlat, fence["lat"] + dlat, fence["lon"] - dlon, fence["lon"] + dlon)
+
+# fence centres in radians plus (minLat, maxLat, minLon, maxLon) boxes in
+# degrees, evaluated together on every sample; both kernels run the box test
+# first and only do the haversine trig for fences whose box holds the point
+_fence_names = list(GEOfences)
+_fence_lat = np.radians([f["lat"] for f in GEOfences.values()])
+_fence_lon = np.radians([f["lon"] for f in GEOfences.values()])
+_fence_r = np.array([f["radius_m"] for f in GEOfences.values()], dtype=float)
+_fence_box = np.array([_fence_bbox(f) for f in GEOfences.values()], dtype=float).reshape(-1, 4)
+
+def _zone_index_loop(lat, lon, flat, flon, fr, fbox):
+    lat_r = math.radians(lat)
+    lon_r = math.radians(lon)
+    cos_lat = math.cos(lat_r)
+    for i in range(flat.shape[0]):
+        if lat < fbox[i, 0] or lat > fbox[i, 1] or lon < fbox[i, 2] or lon > fbox[i, 3]:
+            continue
+        dlat = flat[i] - lat_r
+        dlon = flon[i] - lon_r
+        a = math.sin(dlat/2)**2 + cos_lat*math.cos(flat[i])*math.sin(dlon/2)**2
+        if 2*EARTH_RADIUS_M*math.asin(math.sqrt(a)) <= fr[i]:
+            return i
+    return -1
+
+def _zone_index_numpy(lat, lon, flat, flon, fr, fbox):
+    cand = np.flatnonzero((fbox[:, 0] <= lat) & (lat <= fbox[:, 1]) & (fbox[:, 2] <= lon) & (lon <= fbox[:, 3]))
+    if cand.size == 0:
+        return -1
+    lat_r = np.radians(lat)
+    lon_r = np.radians(lon)
+    clat = flat[cand]
+    dlat = clat - lat_r
+    dlon = flon[cand] - lon_r
+    a = np.sin(dlat/2)**2 + np.cos(lat_r)*np.cos(clat)*np.sin(dlon/2)**2
+    inside = 2*EARTH_RADIUS_M*np.arcsin(np.sqrt(a)) <= fr[cand]
+    idx = int(np.argmax(inside))
+    return int(cand[idx]) if inside[idx] else -1
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    lat1_r = math.radians(lat1)
+    lat2_r = math.radians(lat2)
+    dlat = lat2_r - lat1_r
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat/2)**2 + math.cos(lat1_r)*math.cos(lat2_r)*math.sin(dlon/2)**2
+    return 2*EARTH_RADIUS_M*math.asin(math.sqrt(a))
 
-# minimal in-memory state for trip detection
+if njit is not None:
+    zone_index = njit(fastmath=True, cache=True)(_zone_index_loop)
+    haversine_m = njit(fastmath=True, cache=True)(_haversine_m)
+else:
+    zone_index = _zone_index_numpy
+    haversine_m = _haversine_m
+
+def current_zone(lat, lon):
+    idx = zone_index(lat, lon, _fence_lat, _fence_lon, _fence_r, _fence_box)
+    return _fence_names[idx] if idx >= 0 else None
+
+# minimal in-memory state for trip detection:
+# device_id -> (lastZone, enter_time, enter_lat, enter_lon). Only the trip
+# worker thread touches it (the exit hook joins that thread before draining
+# _trip_q itself), so no locking is needed.
 device_state = {}
 
 def detect_trip_and_record(device_id, lat, lon, ts):
-    state = device_state.get(device_id, {"lastZone": None, "enter_time": None, "enter_pos": None})
-    currentZone = None
-    for zone_name, fence in GEOfences.items():
-        if inside_geofence(lat, lon, fence):
-            currentZone = zone_name
-            break
+    currentZone = current_zone(lat, lon)
+    state = device_state.get(device_id)
+    lastZone = state[0] if state else None
 
-    if state["lastZone"] is None and currentZone is not None:
-        state["lastZone"] = currentZone
-        state["enter_time"] = ts
-        state["enter_pos"] = (lat, lon)
-    elif state["lastZone"] == currentZone:
-        pass
-    elif state["lastZone"] is not None and currentZone is not None and state["lastZone"] != currentZone:
-        enter_time = state["enter_time"]
-        enter_pos = state["enter_pos"]
+    if currentZone is None:
+        device_state.pop(device_id, None)
+        return
+    if lastZone == currentZone:
+        return
+    if lastZone is not None:
+        _, enter_time, enter_lat, enter_lon = state
         duration = (ts - enter_time).total_seconds() if enter_time else None
-        distance_m = haversine(enter_pos, (lat, lon), unit=Unit.METERS) if enter_pos else None
+        distance_m = haversine_m(enter_lat, enter_lon, lat, lon)
         if duration and distance_m and duration >= MIN_TRIP_TIME_S and distance_m >= MIN_TRIP_DISTANCE_M:
-            trip = Trip(
+            db.session.execute(Trip.__table__.insert().values(
                 device_id=device_id,
                 start_time=enter_time,
                 end_time=ts,
-                start_lat=enter_pos[0],
-                start_lon=enter_pos[1],
+                start_lat=enter_lat,
+                start_lon=enter_lon,
                 end_lat=lat,
                 end_lon=lon,
                 distance_m=distance_m,
                 duration_s=duration
-            )
-            db.session.add(trip)
+            ))
+            day_upsert = sqlite_insert(TripDaily).values(day=enter_time.date().isoformat(), cnt=1, m_sum=distance_m)
+            day_upsert = day_upsert.on_conflict_do_update(index_elements=["day"], set_={"cnt": TripDaily.cnt + 1, "m_sum": TripDaily.m_sum + day_upsert.excluded.m_sum})
+            db.session.execute(day_upsert)
+            # state only moves past the crossing once its trip is stored
             db.session.commit()
-        state["lastZone"] = currentZone
-        state["enter_time"] = ts
-        state["enter_pos"] = (lat, lon)
-    else:
-        if currentZone is None:
-            state["lastZone"] = None
-            state["enter_time"] = None
-            state["enter_pos"] = None
+    device_state[device_id] = (currentZone, ts, lat, lon)
+
+# ---- Batched location ingest ----
+# POSTs only enqueue; one background thread writes up to LOC_BATCH_MAX rows
+# (plus the matching device last_seen upserts) per transaction so the fsync
+# cost is shared by the whole batch and stays off the request path.
+# Committed fixes are then handed to the trip worker through _trip_q.
+_loc_queue = queue.Queue(maxsize=LOC_QUEUE_MAX)
+_trip_q = queue.Queue(maxsize=LOC_QUEUE_MAX)
+# set at exit: each worker finishes the batch it holds and returns
+_stop_flusher = threading.Event()
+_stop_trips = threading.Event()
+
+def drain_upto(q, max_items, timeout):
+    items = []
+    deadline = time.monotonic() + timeout
+    while len(items) < max_items:
+        remaining = deadline - time.monotonic()
+        try:
+            items.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+# device_id -> last_seen as stored in the DB; only the flusher thread uses it.
+# last_seen is rewritten once it drifts by DEVICE_TOUCH_INTERVAL, so most
+# batches need no device write at all.
+_device_cache = {}
+
+def write_locations(batch):
+    # last fix in the batch wins, as it did with one upsert per POST
+    last_seen = {row["device_id"]: row["timestamp"] for row in batch}
+    touched = {}
+    for d, ts in last_seen.items():
+        cached = _device_cache.get(d)
+        if cached is None or ts - cached > DEVICE_TOUCH_INTERVAL:
+            touched[d] = ts
+    upsert = sqlite_insert(Device)
+    upsert = upsert.on_conflict_do_update(index_elements=["device_id"], set_={"last_seen": upsert.excluded.last_seen})
+    with db.engine.begin() as conn:
+        conn.execute(Location.__table__.insert(), batch)
+        if touched:
+            conn.execute(upsert, [{"device_id": d, "name": d, "last_seen": ts} for d, ts in touched.items()])
+    _device_cache.update(touched)
+
+def flush_locations(batch):
+    try:
+        write_locations(batch)
+    except (IntegrityError, TypeError):
+        # a row slipped past validation: write the batch row by row so
+        # only the offending rows are lost
+        good = []
+        for row in batch:
+            try:
+                write_locations([row])
+                good.append(row)
+            except (IntegrityError, TypeError):
+                current_app.logger.exception("Dropping location row for %r", row.get("device_id"))
+        batch = good
+    for row in batch:
+        _trip_q.put((row["device_id"], row["lat"], row["lon"], row["timestamp"]))
 
-    device_state[device_id] = state
+def location_flusher(app):
+    with app.app_context():
+        while not _stop_flusher.is_set():
+            batch = drain_upto(_loc_queue, LOC_BATCH_MAX, LOC_FLUSH_INTERVAL_S)
+            if not batch:
+                continue
+            try:
+                flush_locations(batch)
+            except Exception:
+                app.logger.exception("Location flush failed (%d rows dropped)", len(batch))
+
+def process_trips(items):
+    # a failing sample is logged and skipped; trips from the rest of the
+    # batch are unaffected because each one commits on its own
+    for device_id, lat, lon, ts in items:
+        try:
+            detect_trip_and_record(device_id, lat, lon, ts)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception("Trip detect error for %s", device_id)
+
+def trip_worker(app):
+    with app.app_context():
+        while not _stop_trips.is_set():
+            items = drain_upto(_trip_q, LOC_BATCH_MAX, LOC_FLUSH_INTERVAL_S)
+            if items:
+                process_trips(items)
+
+def flush_pending_locations(app, flusher, trips):
+    # stop the flusher first and write what it left behind while the trip
+    # worker is still consuming _trip_q, then stop that and drain it too
+    with app.app_context():
+        _stop_flusher.set()
+        flusher.join()
+        batch = drain_upto(_loc_queue, LOC_QUEUE_MAX, 0)
+        if batch:
+            try:
+                flush_locations(batch)
+            except Exception:
+                app.logger.exception("Location flush failed (%d rows dropped)", len(batch))
+        _stop_trips.set()
+        trips.join()
+        items = drain_upto(_trip_q, LOC_QUEUE_MAX, 0)
+        if items:
+            process_trips(items)
+
+# ---- Latest fix per device ----
+# device_id -> (lat, lon, speed_kmh, wall-time timestamp), primed from the DB at
+# startup and kept current by the write path; reads never touch SQLite.
+_latest = {}
+_latest_lock = threading.Lock()
+
+def update_latest(device_id, lat, lon, speed, ts):
+    with _latest_lock:
+        cur = _latest.get(device_id)
+        if cur is None or ts >= cur[3]:
+            _latest[device_id] = (lat, lon, speed, ts)
+
+def load_latest():
+    # SQLite returns the bare columns from the row holding MAX(timestamp)
+    q = db.session.query(Location.device_id, Location.lat, Location.lon, Location.speed_kmh, func.max(Location.timestamp).label("timestamp")).group_by(Location.device_id).all()
+    for row in q:
+        update_latest(row.device_id, row.lat, row.lon, row.speed_kmh, row.timestamp)
+
+# ---- Schema & startup ----
+def init_db():
+    db.create_all()
+    # create_all skips indexes on tables that already exist
+    loc_dev_ts_index.create(db.engine, checkfirst=True)
+    # backfill the rollup for trips recorded before it existed
+    if db.session.query(TripDaily.day).first() is None:
+        day = func.date(Trip.start_time)
+        backfill = select(day, func.count(Trip.id), func.coalesce(func.sum(Trip.distance_m), 0.0)).where(Trip.start_time.is_not(None)).group_by(day)
+        db.session.execute(TripDaily.__table__.insert().from_select(["day", "cnt", "m_sum"], backfill))
+    for stmt in LOCATION_RTREE_DDL:
+        db.session.execute(text(stmt))
+    db.session.commit()
+
+    for d, seen in db.session.query(Device.device_id, Device.last_seen):
+        if seen is not None:
+            _device_cache[d] = seen
+    load_latest()
+
+@functools.cache
+def create_app():
+    # memoized: a process builds, migrates and starts workers for one app only
+    app = Flask(__name__, template_folder="templates", static_folder="static")
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///ebuggy.db"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # one pooled connection per gunicorn thread plus the background flusher;
+    # WAL lets them read concurrently while busy_timeout queues the writers
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "poolclass": QueuePool,
+        "pool_size": 8,
+        "max_overflow": 16,
+        "connect_args": {"check_same_thread": False, "timeout": 10},
+    }
+    app.logger.setLevel(getattr(logging, LOG_LEVEL, logging.WARNING))
+    db.init_app(app)
+    app.register_blueprint(bp)
+
+    with app.app_context():
+        event.listen(db.engine, "connect", set_sqlite_pragmas)
+        init_db()
+
+    flusher = threading.Thread(target=location_flusher, args=(app,), name="location-flusher", daemon=True)
+    trips = threading.Thread(target=trip_worker, args=(app,), name="trip-worker", daemon=True)
+    flusher.start()
+    trips.start()
+    atexit.register(flush_pending_locations, app, flusher, trips)
+    return app
+
+def orjson_response(obj):
+    return current_app.response_class(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY), mimetype="application/json")
 
 # ---- Routes ----
-@app.route("/")
+bp = Blueprint("ebuggy", __name__)
+
+@bp.route("/")
 def index():
     return render_template("index.html")
 
-@app.route("/api/location", methods=["POST"])
+@bp.route("/api/location", methods=["POST"])
 def api_location():
     data = request.get_json(force=True) if request.is_json else request.form.to_dict()
     device_id = data.get("device_id") or data.get("deviceId") or data.get("device")
     api_key = data.get("api_key") or request.headers.get("X-API-KEY")
-    if API_KEY and api_key != API_KEY:
+    if API_KEY and not hmac.compare_digest(_API_KEY_B, str(api_key or "").encode()):
         return jsonify({"status":"error","message":"invalid api key"}), 401
+    # rows are written in shared batches, so reject anything that would fail the insert
+    if not device_id or not isinstance(device_id, str):
+        return jsonify({"status":"error","message":"device_id missing or invalid"}), 400
     try:
         lat = float(data.get("lat") or data.get("latitude"))
         lon = float(data.get("lon") or data.get("longitude"))
     except:
         return jsonify({"status":"error","message":"lat/lon missing or invalid"}), 400
+    # SQLite stores NaN as NULL, which the NOT NULL lat/lon columns reject
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        return jsonify({"status":"error","message":"lat/lon missing or invalid"}), 400
     speed = float(data.get("speed_kmh") or data.get("speed") or 0)
     ts_raw = data.get("timestamp") or data.get("time")
-    ts = parse_iso(ts_raw) if ts_raw else datetime.utcnow().replace(tzinfo=timezone.utc)
-
-    dev = Device.query.filter_by(device_id=device_id).first()
-    if not dev:
-        dev = Device(device_id=device_id, name=device_id, last_seen=ts)
-        db.session.add(dev)
-        db.session.commit()
-    else:
-        dev.last_seen = ts
-        db.session.commit()
-
-    loc = Location(device_id=device_id, lat=lat, lon=lon, speed_kmh=speed, timestamp=ts)
-    db.session.add(loc)
-    db.session.commit()
+    ts = _wall_time(parse_iso(ts_raw) if ts_raw else datetime.utcnow())
 
     try:
-        detect_trip_and_record(device_id, lat, lon, ts)
-    except Exception as e:
-        print("Trip detect error:", e)
+        _loc_queue.put_nowait({"device_id": device_id, "lat": lat, "lon": lon, "speed_kmh": speed, "timestamp": ts})
+    except queue.Full:
+        return jsonify({"status":"error","message":"ingest queue full"}), 503
+    update_latest(device_id, lat, lon, speed, ts)
 
-    print("Received:", device_id, lat, lon, ts.isoformat())
+    current_app.logger.info("Received: %s %s %s %s", device_id, lat, lon, ts)
     return jsonify({"status":"ok"})
 
-@app.route('/api/devices/latest', methods=['GET'])
+@bp.route('/api/devices/latest', methods=['GET'])
 def api_devices_latest():
-    q = db.session.query(Location.device_id, Location.lat, Location.lon, Location.speed_kmh, Location.timestamp).order_by(Location.timestamp.desc()).all()
-    latest = {}
-    for row in q:
-        if row.device_id not in latest:
-            latest[row.device_id] = {"device_id": row.device_id, "lat": row.lat, "lon": row.lon, "speed_kmh": row.speed_kmh, "timestamp": row.timestamp.isoformat()}
-    return jsonify(list(latest.values()))
+    with _latest_lock:
+        items = list(_latest.items())
+    latest = [{"device_id": device_id, "lat": lat, "lon": lon, "speed_kmh": speed, "timestamp": ts} for device_id, (lat, lon, speed, ts) in items]
+    return orjson_response(latest)
 
-@app.route('/api/trips/summary', methods=['GET'])
+@bp.route('/api/trips/summary', methods=['GET'])
 def api_trips_summary():
-    from sqlalchemy import func
-    q = db.session.query(func.date(Trip.start_time).label("day"), func.count(Trip.id).label("cnt"), func.sum(Trip.distance_m).label("m_sum")).group_by(func.date(Trip.start_time)).order_by(func.date(Trip.start_time)).all()
-    results = []
-    total_trips = 0
-    total_m = 0.0
-    for row in q:
-        results.append({"day": str(row.day), "trips": int(row.cnt), "distance_m": float(row.m_sum or 0.0)})
-        total_trips += int(row.cnt)
-        total_m += float(row.m_sum or 0.0)
+    # grand totals ride along on every row via window sums, so one query covers both
+    q = db.session.query(TripDaily.day, TripDaily.cnt, TripDaily.m_sum, func.sum(TripDaily.cnt).over().label("total_trips"), func.sum(TripDaily.m_sum).over().label("total_m")).order_by(TripDaily.day).all()
+    results = [{"day": row.day, "trips": row.cnt, "distance_m": row.m_sum} for row in q]
+    total_trips = q[0].total_trips if q else 0
+    total_m = q[0].total_m if q else 0.0
     total_km = total_m/1000.0
     co2_saved_kg = total_km * EMISSION_FACTOR_KG_PER_KM
-    return jsonify({"days": results, "total_trips": total_trips, "total_km": total_km, "co2_saved_kg": co2_saved_kg})
+    return orjson_response({"days": results, "total_trips": total_trips, "total_km": total_km, "co2_saved_kg": co2_saved_kg})
 
-@app.route('/api/trips/list', methods=['GET'])
+@bp.route('/api/trips/list', methods=['GET'])
 def api_trips_list():
-    trips = Trip.query.order_by(Trip.start_time.desc()).limit(200).all()
-    out = []
-    for t in trips:
-        out.append({
-            "device_id": t.device_id,
-            "start_time": t.start_time.isoformat(),
-            "end_time": t.end_time.isoformat(),
-            "distance_m": t.distance_m,
-            "duration_s": t.duration_s,
-            "start_lat": t.start_lat,
-            "start_lon": t.start_lon,
-            "end_lat": t.end_lat,
-            "end_lon": t.end_lon
-        })
-    return jsonify(out)
+    cols = (Trip.device_id, Trip.start_time, Trip.end_time, Trip.distance_m, Trip.duration_s, Trip.start_lat, Trip.start_lon, Trip.end_lat, Trip.end_lon)
+    rows = db.session.execute(select(*cols).order_by(Trip.start_time.desc()).limit(200)).all()
+    out = [dict(row._mapping) for row in rows]
+    return orjson_response(out)
+
+# dev server only; production runs create_app() under gunicorn (see Procfile)
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))
+    create_app().run(host="0.0.0.0", port=port)